@@ -1,9 +1,13 @@
 import asyncio
-import json
+import logging
+import queue
 import re
-from datetime import datetime
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 
 import aiosqlite
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import CommandStart
 from aiogram.types import (
@@ -14,16 +18,57 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramBadRequest
 
 from config import BOT_TOKEN, ADMIN_IDS, ADMIN_USERNAME, DB_PATH
 
+try:
+    import uvloop
+except ImportError:  # uvloop є лише на Linux/macOS — без нього працюємо на стандартному циклі
+    uvloop = None
+
+logger = logging.getLogger("bot")
+
+
+def setup_logging() -> QueueListener:
+    """
+    Логи йдуть у чергу, а в stderr їх пише окремий потік — event loop не блокується на виводі.
+    """
+    q = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(q, stream)
+    logging.basicConfig(level=logging.WARNING, handlers=[QueueHandler(q)])
+    logger.setLevel(logging.INFO)
+    listener.start()
+    return listener
+
 
 # ----------------- DB -----------------
-async def db_init():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript("""
+POOL: SQLiteConnectionPool | None = None
+
+
+async def db_connect():
+    """
+    Фабрика з'єднань для пулу: кожне з'єднання одразу налаштоване PRAGMA.
+    """
+    db = await aiosqlite.connect(DB_PATH)
+    await db.executescript("""
         PRAGMA foreign_keys = ON;
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA mmap_size = 268435456;
+        PRAGMA cache_size = -20000;
+    """)
+    return db
+
 
+async def db_init():
+    # PRAGMA (зокрема journal_mode = WAL) вмикає db_connect
+    db = await db_connect()
+    try:
+        await db.executescript("""
         CREATE TABLE IF NOT EXISTS products(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -69,12 +114,19 @@ async def db_init():
             qty INTEGER NOT NULL,
             FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE
         );
+
+        CREATE INDEX IF NOT EXISTS idx_cart_product ON cart(product_id);
+        CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+        CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id);
+        CREATE INDEX IF NOT EXISTS idx_products_active_id ON products(active, id DESC);
         """)
         await db.commit()
+    finally:
+        await db.close()
 
 
 async def db_fetchone(query, args=()):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with POOL.connection() as db:
         cur = await db.execute(query, args)
         row = await cur.fetchone()
         await cur.close()
@@ -82,7 +134,7 @@ async def db_fetchone(query, args=()):
 
 
 async def db_fetchall(query, args=()):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with POOL.connection() as db:
         cur = await db.execute(query, args)
         rows = await cur.fetchall()
         await cur.close()
@@ -90,16 +142,24 @@ async def db_fetchall(query, args=()):
 
 
 async def db_execute(query, args=()):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with POOL.connection() as db:
         await db.execute(query, args)
         await db.commit()
 
 
 # ----------------- Helpers -----------------
+_VARIANT_SPLIT = re.compile(r"[,; ]+")
+_PHONE_KEEP = re.compile(r"[^\d+]")
+_DIGITS_ONLY = re.compile(r"\D")
+
+
+_ADMIN_USERNAME_LOWER = ADMIN_USERNAME.lower()
+
+
 def is_admin_user(user_id: int, username: str | None) -> bool:
     if user_id in ADMIN_IDS:
         return True
-    if username and username.lower() == ADMIN_USERNAME.lower():
+    if username and username.lower() == _ADMIN_USERNAME_LOWER:
         return True
     return False
 
@@ -112,7 +172,7 @@ def parse_variants(text: str) -> list[str]:
     t = text.strip()
     if t in ("-", ""):
         return []
-    parts = re.split(r"[,; ]+", t)
+    parts = _VARIANT_SPLIT.split(t)
     variants = [p.strip() for p in parts if p.strip()]
     seen = set()
     res = []
@@ -123,30 +183,59 @@ def parse_variants(text: str) -> list[str]:
     return res
 
 
+# Статичні клавіатури будуємо один раз і віддаємо ті самі об'єкти.
+_MAIN_KB_ROWS = [
+    [InlineKeyboardButton(text="🛍 Каталог", callback_data="cat:0")],
+    [InlineKeyboardButton(text="🧺 Кошик", callback_data="cart:view")],
+    [InlineKeyboardButton(text="ℹ️ Оплата/Доставка", callback_data="info")],
+    [InlineKeyboardButton(text="📞 Контакти", callback_data="contacts")],
+]
+_MAIN_KB_USER = InlineKeyboardMarkup(inline_keyboard=_MAIN_KB_ROWS)
+_MAIN_KB_ADMIN = InlineKeyboardMarkup(inline_keyboard=_MAIN_KB_ROWS + [
+    [InlineKeyboardButton(text="🔧 Адмін-меню", callback_data="admin:menu")],
+])
+
+_ADMIN_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="➕ Додати товар", callback_data="admin:add")],
+    [InlineKeyboardButton(text="📦 Мої товари", callback_data="admin:products:0")],
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data="home")],
+])
+
+_BACK_HOME_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⬅️ На головну", callback_data="home")]
+])
+
+_CART_EMPTY_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🛍 Перейти в каталог", callback_data="cat:0")],
+    [InlineKeyboardButton(text="🏠 На головну", callback_data="home")],
+])
+
+_NP_TYPE_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🏤 Відділення", callback_data="np:type:branch")],
+    [InlineKeyboardButton(text="📦 Поштомат", callback_data="np:type:locker")],
+])
+
+_PAYMENT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💵 Накладений платіж", callback_data="pay:cod")],
+    [InlineKeyboardButton(text="💳 Передоплата", callback_data="pay:prepay")],
+])
+
+_CHECKOUT_CONFIRM_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✅ Підтвердити", callback_data="checkout:confirm")],
+    [InlineKeyboardButton(text="❌ Скасувати", callback_data="checkout:cancel")],
+])
+
+
 def main_kb(is_admin: bool) -> InlineKeyboardMarkup:
-    buttons = [
-        [InlineKeyboardButton(text="🛍 Каталог", callback_data="cat:0")],
-        [InlineKeyboardButton(text="🧺 Кошик", callback_data="cart:view")],
-        [InlineKeyboardButton(text="ℹ️ Оплата/Доставка", callback_data="info")],
-        [InlineKeyboardButton(text="📞 Контакти", callback_data="contacts")],
-    ]
-    if is_admin:
-        buttons.append([InlineKeyboardButton(text="🔧 Адмін-меню", callback_data="admin:menu")])
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    return _MAIN_KB_ADMIN if is_admin else _MAIN_KB_USER
 
 
 def admin_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Додати товар", callback_data="admin:add")],
-        [InlineKeyboardButton(text="📦 Мої товари", callback_data="admin:products:0")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="home")],
-    ])
+    return _ADMIN_KB
 
 
 def back_home_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ На головну", callback_data="home")]
-    ])
+    return _BACK_HOME_KB
 
 
 async def safe_edit_text(c: CallbackQuery, text: str, reply_markup=None):
@@ -162,17 +251,50 @@ async def safe_edit_text(c: CallbackQuery, text: str, reply_markup=None):
         await c.message.answer(text, reply_markup=reply_markup)
 
 
+# file_id -> "photo" / "document" / "text": яким способом Telegram прийняв файл минулого разу
+# ("text" — файл недоступний, шлемо картку без медіа)
+_SENT_AS: dict[str, str] = {}
+
+
 async def send_photo_or_document(m: Message, file_id: str, caption: str, reply_markup=None):
     """
     Фікс "unsupported file type":
     - пробуємо відправити як фото
     - якщо Telegram відмовив — відправляємо як документ
+    - якщо файл недоступний зовсім — відправляємо текст без медіа
+    - запам'ятовуємо, що спрацювало, щоб не повторювати невдалі спроби
+      (лише якщо Telegram саме відхилив файл, а не через мережу/flood control)
     """
+    sent_as = _SENT_AS.get(file_id)
+
+    if sent_as == "text":
+        await m.answer(caption, reply_markup=reply_markup)
+        return
+
+    photo_rejected = sent_as == "document"
+    if not photo_rejected:
+        try:
+            await m.answer_photo(photo=file_id, caption=caption, reply_markup=reply_markup)
+            _SENT_AS[file_id] = "photo"
+            return
+        except TelegramBadRequest as e:
+            logger.warning("answer_photo rejected, fallback to document: %s", e)
+            photo_rejected = True
+        except Exception as e:
+            logger.warning("answer_photo failed, fallback to document: %s", e)
+
     try:
-        await m.answer_photo(photo=file_id, caption=caption, reply_markup=reply_markup)
-    except Exception as e:
-        print(f"⚠️ answer_photo failed, fallback to document: {e}")
         await m.answer_document(document=file_id, caption=caption, reply_markup=reply_markup)
+        if photo_rejected:
+            _SENT_AS[file_id] = "document"
+    except TelegramBadRequest as e:
+        logger.warning("answer_document rejected, fallback to text: %s", e)
+        await m.answer(caption, reply_markup=reply_markup)
+        if photo_rejected:
+            _SENT_AS[file_id] = "text"
+    except Exception as e:
+        logger.warning("answer_document failed, fallback to text: %s", e)
+        await m.answer(caption, reply_markup=reply_markup)
 
 
 # ----------------- FSM -----------------
@@ -200,6 +322,18 @@ router = Router()
 PAGE_SIZE = 5
 
 
+async def prev_page_cursor(first_id: int, active_only: bool) -> int:
+    """
+    Keyset-пагінація: курсор попередньої сторінки (0 — перша сторінка).
+    """
+    cond = "active=1 AND " if active_only else ""
+    rows = await db_fetchall(
+        f"SELECT id FROM products WHERE {cond}id > ? ORDER BY id LIMIT ?",
+        (first_id, PAGE_SIZE + 1)
+    )
+    return rows[PAGE_SIZE][0] if len(rows) > PAGE_SIZE else 0
+
+
 # ----------------- Start + /myid -----------------
 @router.message(CommandStart())
 async def start(m: Message):
@@ -250,9 +384,83 @@ async def contacts(c: CallbackQuery):
 
 
 # ----------------- Catalog -----------------
+# Товари змінює лише адмін, тому тримаємо їх у пам'яті й скидаємо кеш при змінах.
+_PROD_CACHE: dict[int, tuple] = {}
+# Ключ — курсор з callback data, яку клієнт може підставити будь-яку,
+# тому сторінки тримаємо в обмеженому LRU.
+_PROD_LIST_CACHE: OrderedDict[int, tuple[list, int]] = OrderedDict()
+_PROD_LIST_CACHE_MAX = 64
+# Збільшується при кожному скиданні кешу: результат запиту, що почався до скидання,
+# у кеш не потрапляє.
+_PROD_CACHE_GEN = 0
+
+
+def drop_product_cache(pid: int | None = None):
+    global _PROD_CACHE_GEN
+    _PROD_CACHE_GEN += 1
+    if pid is not None:
+        _PROD_CACHE.pop(pid, None)
+    _PROD_LIST_CACHE.clear()
+
+
+async def get_product(pid: int):
+    """
+    (id, title, price, description, photo_file_id, variants) активного товару або None.
+    variants — вже розпарсений список.
+    """
+    prod = _PROD_CACHE.get(pid)
+    if prod is not None:
+        return prod
+
+    gen = _PROD_CACHE_GEN
+    row = await db_fetchone(
+        "SELECT id, title, price, description, photo_file_id, variants_json FROM products WHERE id=? AND active=1",
+        (pid,)
+    )
+    if not row:
+        return None
+
+    prod = row[:5] + (orjson.loads(row[5] or "[]"),)
+    if gen == _PROD_CACHE_GEN:
+        _PROD_CACHE[pid] = prod
+    return prod
+
+
+async def catalog_page(before: int) -> tuple[list, int]:
+    """
+    Рядки сторінки каталогу та курсор попередньої сторінки.
+    """
+    page = _PROD_LIST_CACHE.get(before)
+    if page is not None:
+        _PROD_LIST_CACHE.move_to_end(before)
+        return page
+
+    gen = _PROD_CACHE_GEN
+    if before:
+        rows = await db_fetchall(
+            "SELECT id, title, price FROM products WHERE active=1 AND id < ? ORDER BY id DESC LIMIT ?",
+            (before, PAGE_SIZE)
+        )
+    else:
+        rows = await db_fetchall(
+            "SELECT id, title, price FROM products WHERE active=1 ORDER BY id DESC LIMIT ?",
+            (PAGE_SIZE,)
+        )
+
+    prev = 0
+    if before and rows:
+        prev = await prev_page_cursor(rows[0][0], active_only=True)
+
+    page = (rows, prev)
+    if gen == _PROD_CACHE_GEN:
+        _PROD_LIST_CACHE[before] = page
+        if len(_PROD_LIST_CACHE) > _PROD_LIST_CACHE_MAX:
+            _PROD_LIST_CACHE.popitem(last=False)
+    return page
+
+
 async def send_product_card(chat_msg: Message, prod):
-    pid, title, price, desc, photo_id, variants_json = prod
-    variants = json.loads(variants_json or "[]")
+    pid, title, price, desc, photo_id, variants = prod
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🧺 Додати в кошик", callback_data=f"cart:add:{pid}")],
@@ -270,32 +478,30 @@ async def send_product_card(chat_msg: Message, prod):
 
 @router.callback_query(F.data.startswith("cat:"))
 async def catalog(c: CallbackQuery):
-    page = int(c.data.split(":")[1])
-    offset = page * PAGE_SIZE
-
-    rows = await db_fetchall(
-        "SELECT id, title, price FROM products WHERE active=1 ORDER BY id DESC LIMIT ? OFFSET ?",
-        (PAGE_SIZE, offset)
-    )
+    # cat:<id> — показуємо товари з id < <id>; 0 — перша сторінка
+    before = int(c.data.split(":")[1])
+    rows, prev = await catalog_page(before)
 
     if not rows:
         await safe_edit_text(c, "Каталог порожній 😕", reply_markup=back_home_kb())
         await c.answer()
         return
 
-    text = "🛍 Каталог товарів\n\n"
+    parts = ["🛍 Каталог товарів\n\n"]
     kb_rows = []
 
     for pid, title, price in rows:
-        text += f"• {title} — {money(price)}\n"
+        parts.append(f"• {title} — {money(price)}\n")
         kb_rows.append([InlineKeyboardButton(text=f"🔎 {title}", callback_data=f"prod:{pid}")])
 
+    text = "".join(parts)
+
     nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"cat:{page-1}"))
+    if before:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"cat:{prev}"))
     nav.append(InlineKeyboardButton(text="🧺 Кошик", callback_data="cart:view"))
     nav.append(InlineKeyboardButton(text="🏠", callback_data="home"))
-    nav.append(InlineKeyboardButton(text="➡️", callback_data=f"cat:{page+1}"))
+    nav.append(InlineKeyboardButton(text="➡️", callback_data=f"cat:{rows[-1][0]}"))
     kb_rows.append(nav)
 
     await safe_edit_text(c, text, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb_rows))
@@ -305,10 +511,7 @@ async def catalog(c: CallbackQuery):
 @router.callback_query(F.data.startswith("prod:"))
 async def product_view(c: CallbackQuery):
     pid = int(c.data.split(":")[1])
-    prod = await db_fetchone(
-        "SELECT id, title, price, description, photo_file_id, variants_json FROM products WHERE id=? AND active=1",
-        (pid,)
-    )
+    prod = await get_product(pid)
     if not prod:
         await c.answer("Товар не знайдено", show_alert=True)
         return
@@ -328,40 +531,58 @@ async def cart_total(user_id: int) -> int:
     return sum(qty * price for qty, price in rows)
 
 
+CART_ITEMS_SQL = """
+    SELECT c.product_id, p.title, p.price, c.qty, c.variant
+    FROM cart c
+    JOIN products p ON p.id=c.product_id
+    WHERE c.user_id=? AND p.active=1
+    ORDER BY p.id DESC
+"""
+
+
 async def cart_items(user_id: int):
-    return await db_fetchall("""
-        SELECT c.product_id, p.title, p.price, c.qty, c.variant
-        FROM cart c
-        JOIN products p ON p.id=c.product_id
-        WHERE c.user_id=? AND p.active=1
-        ORDER BY p.id DESC
-    """, (user_id,))
+    return await db_fetchall(CART_ITEMS_SQL, (user_id,))
+
+
+async def cart_apply(user_id: int, *statements):
+    """
+    Виконує зміни кошика і одразу читає його вміст — на одному з'єднанні з пулу.
+    statements — пари (query, args).
+    """
+    async with POOL.connection() as db:
+        for query, args in statements:
+            await db.execute(query, args)
+        await db.commit()
+        cur = await db.execute(CART_ITEMS_SQL, (user_id,))
+        rows = await cur.fetchall()
+        await cur.close()
+        return rows
 
 
 @router.callback_query(F.data == "cart:view")
 async def cart_view(c: CallbackQuery):
     items = await cart_items(c.from_user.id)
+    await render_cart(c, items)
+
 
+async def render_cart(c: CallbackQuery, items):
     if not items:
         await safe_edit_text(
             c,
             "🧺 Кошик порожній.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🛍 Перейти в каталог", callback_data="cat:0")],
-                [InlineKeyboardButton(text="🏠 На головну", callback_data="home")],
-            ])
+            reply_markup=_CART_EMPTY_KB
         )
         await c.answer()
         return
 
-    total = await cart_total(c.from_user.id)
+    total = sum(price * qty for _, _, price, qty, _ in items)
 
-    text = "🧺 Твій кошик:\n\n"
+    parts = ["🧺 Твій кошик:\n\n"]
     kb_rows = []
 
     for pid, title, price, qty, variant in items:
         vtxt = f" ({variant})" if variant else ""
-        text += f"• {title}{vtxt} — {money(price)} × {qty} = {money(price * qty)}\n"
+        parts.append(f"• {title}{vtxt} — {money(price)} × {qty} = {money(price * qty)}\n")
         kb_rows.append([
             InlineKeyboardButton(text="➖", callback_data=f"cart:dec:{pid}:{variant}"),
             InlineKeyboardButton(text=f"{qty}", callback_data="noop"),
@@ -369,7 +590,8 @@ async def cart_view(c: CallbackQuery):
             InlineKeyboardButton(text="🗑", callback_data=f"cart:del:{pid}:{variant}"),
         ])
 
-    text += f"\nРазом: {money(total)}"
+    parts.append(f"\nРазом: {money(total)}")
+    text = "".join(parts)
 
     kb_rows.append([InlineKeyboardButton(text="✅ Оформити", callback_data="checkout:start")])
     kb_rows.append([
@@ -391,18 +613,18 @@ async def noop(c: CallbackQuery):
 async def cart_clear(c: CallbackQuery):
     await db_execute("DELETE FROM cart WHERE user_id=?", (c.from_user.id,))
     await c.answer("Кошик очищено ✅")
-    await cart_view(c)
+    await render_cart(c, [])
 
 
 @router.callback_query(F.data.startswith("cart:add:"))
 async def cart_add(c: CallbackQuery):
     pid = int(c.data.split(":")[2])
-    prod = await db_fetchone("SELECT variants_json FROM products WHERE id=? AND active=1", (pid,))
+    prod = await get_product(pid)
     if not prod:
         await c.answer("Товар не знайдено", show_alert=True)
         return
 
-    variants = json.loads(prod[0] or "[]")
+    variants = prod[5]
 
     if variants:
         kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -412,12 +634,17 @@ async def cart_add(c: CallbackQuery):
         await c.answer()
         return
 
-    await db_execute("""
-        INSERT INTO cart(user_id, product_id, variant, qty)
-        VALUES(?,?,?,1)
-        ON CONFLICT(user_id, product_id, variant)
-        DO UPDATE SET qty=qty+1
-    """, (c.from_user.id, pid, ""))
+    try:
+        await db_execute("""
+            INSERT INTO cart(user_id, product_id, variant, qty)
+            VALUES(?,?,?,1)
+            ON CONFLICT(user_id, product_id, variant)
+            DO UPDATE SET qty=qty+1
+        """, (c.from_user.id, pid, ""))
+    except aiosqlite.IntegrityError:
+        # товар видалили, поки кнопка ще висіла в чаті (foreign_keys = ON)
+        await c.answer("Товар не знайдено", show_alert=True)
+        return
     await c.answer("Додано в кошик ✅")
 
 
@@ -426,25 +653,32 @@ async def cart_add_variant(c: CallbackQuery):
     _, _, pid_s, variant = c.data.split(":", 3)
     pid = int(pid_s)
 
-    await db_execute("""
-        INSERT INTO cart(user_id, product_id, variant, qty)
-        VALUES(?,?,?,1)
-        ON CONFLICT(user_id, product_id, variant)
-        DO UPDATE SET qty=qty+1
-    """, (c.from_user.id, pid, variant))
+    try:
+        items = await cart_apply(c.from_user.id, ("""
+            INSERT INTO cart(user_id, product_id, variant, qty)
+            VALUES(?,?,?,1)
+            ON CONFLICT(user_id, product_id, variant)
+            DO UPDATE SET qty=qty+1
+        """, (c.from_user.id, pid, variant)))
+    except aiosqlite.IntegrityError:
+        # стара клавіатура варіантів після видалення товару (foreign_keys = ON)
+        await c.answer("Товар не знайдено", show_alert=True)
+        return
 
     await c.answer(f"Додано ({variant}) ✅")
-    await cart_view(c)
+    await render_cart(c, items)
 
 
 @router.callback_query(F.data.startswith("cart:inc:"))
 async def cart_inc(c: CallbackQuery):
     _, _, pid_s, variant = c.data.split(":", 3)
     pid = int(pid_s)
-    await db_execute("UPDATE cart SET qty=qty+1 WHERE user_id=? AND product_id=? AND variant=?",
-                     (c.from_user.id, pid, variant))
+    items = await cart_apply(c.from_user.id, (
+        "UPDATE cart SET qty=qty+1 WHERE user_id=? AND product_id=? AND variant=?",
+        (c.from_user.id, pid, variant)
+    ))
     await c.answer()
-    await cart_view(c)
+    await render_cart(c, items)
 
 
 @router.callback_query(F.data.startswith("cart:dec:"))
@@ -452,46 +686,32 @@ async def cart_dec(c: CallbackQuery):
     _, _, pid_s, variant = c.data.split(":", 3)
     pid = int(pid_s)
 
-    row = await db_fetchone("SELECT qty FROM cart WHERE user_id=? AND product_id=? AND variant=?",
-                            (c.from_user.id, pid, variant))
-    if not row:
-        await c.answer()
-        return
+    key = (c.from_user.id, pid, variant)
 
-    qty = row[0]
-    if qty <= 1:
-        await db_execute("DELETE FROM cart WHERE user_id=? AND product_id=? AND variant=?",
-                         (c.from_user.id, pid, variant))
-    else:
-        await db_execute("UPDATE cart SET qty=qty-1 WHERE user_id=? AND product_id=? AND variant=?",
-                         (c.from_user.id, pid, variant))
+    # зменшуємо кількість; позиція, що дійшла до 0, видаляється
+    items = await cart_apply(
+        c.from_user.id,
+        ("UPDATE cart SET qty=qty-1 WHERE user_id=? AND product_id=? AND variant=?", key),
+        ("DELETE FROM cart WHERE user_id=? AND product_id=? AND variant=? AND qty<=0", key),
+    )
 
     await c.answer()
-    await cart_view(c)
+    await render_cart(c, items)
 
 
 @router.callback_query(F.data.startswith("cart:del:"))
 async def cart_del(c: CallbackQuery):
     _, _, pid_s, variant = c.data.split(":", 3)
     pid = int(pid_s)
-    await db_execute("DELETE FROM cart WHERE user_id=? AND product_id=? AND variant=?",
-                     (c.from_user.id, pid, variant))
+    items = await cart_apply(c.from_user.id, (
+        "DELETE FROM cart WHERE user_id=? AND product_id=? AND variant=?",
+        (c.from_user.id, pid, variant)
+    ))
     await c.answer("Видалено 🗑")
-    await cart_view(c)
+    await render_cart(c, items)
 
 
 # ----------------- Checkout -----------------
-class Checkout(StatesGroup):
-    full_name = State()
-    phone = State()
-    city = State()
-    np_type = State()
-    np_point = State()
-    payment = State()
-    comment = State()
-    confirm = State()
-
-
 @router.callback_query(F.data == "checkout:start")
 async def checkout_start(c: CallbackQuery, state: FSMContext):
     items = await cart_items(c.from_user.id)
@@ -514,8 +734,8 @@ async def co_full_name(m: Message, state: FSMContext):
 
 @router.message(Checkout.phone)
 async def co_phone(m: Message, state: FSMContext):
-    phone = re.sub(r"[^\d+]", "", m.text.strip())
-    if len(re.sub(r"\D", "", phone)) < 9:
+    phone = _PHONE_KEEP.sub("", m.text.strip())
+    if len(_DIGITS_ONLY.sub("", phone)) < 9:
         await m.answer("❗️Схоже на неправильний номер. Спробуй ще раз.")
         return
     await state.update_data(phone=phone)
@@ -527,11 +747,7 @@ async def co_phone(m: Message, state: FSMContext):
 async def co_city(m: Message, state: FSMContext):
     await state.update_data(city=m.text.strip())
     await state.set_state(Checkout.np_type)
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🏤 Відділення", callback_data="np:type:branch")],
-        [InlineKeyboardButton(text="📦 Поштомат", callback_data="np:type:locker")],
-    ])
-    await m.answer("Нова Пошта: обери тип доставки:", reply_markup=kb)
+    await m.answer("Нова Пошта: обери тип доставки:", reply_markup=_NP_TYPE_KB)
 
 
 @router.callback_query(Checkout.np_type, F.data.startswith("np:type:"))
@@ -552,11 +768,7 @@ async def co_np_type(c: CallbackQuery, state: FSMContext):
 async def co_np_point(m: Message, state: FSMContext):
     await state.update_data(np_point=m.text.strip())
     await state.set_state(Checkout.payment)
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💵 Накладений платіж", callback_data="pay:cod")],
-        [InlineKeyboardButton(text="💳 Передоплата", callback_data="pay:prepay")],
-    ])
-    await m.answer("💳 Обери оплату:", reply_markup=kb)
+    await m.answer("💳 Обери оплату:", reply_markup=_PAYMENT_KB)
 
 
 @router.callback_query(Checkout.payment, F.data.startswith("pay:"))
@@ -596,12 +808,8 @@ async def co_comment(m: Message, state: FSMContext):
         f"📝 Коментар: {data['comment']}"
     )
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Підтвердити", callback_data="checkout:confirm")],
-        [InlineKeyboardButton(text="❌ Скасувати", callback_data="checkout:cancel")],
-    ])
     await state.set_state(Checkout.confirm)
-    await m.answer(preview, reply_markup=kb)
+    await m.answer(preview, reply_markup=_CHECKOUT_CONFIRM_KB)
 
 
 @router.callback_query(Checkout.confirm, F.data == "checkout:cancel")
@@ -611,6 +819,37 @@ async def checkout_cancel(c: CallbackQuery, state: FSMContext):
     await c.answer()
 
 
+_BG_TASKS: set[asyncio.Task] = set()
+
+
+async def send_to_admin(bot: Bot, admin_id: int, text: str) -> bool:
+    try:
+        await bot.send_message(admin_id, text)
+        logger.debug("Sent to admin_id=%s", admin_id)
+        return True
+    except Exception as e:
+        logger.warning("Failed to send to admin_id=%s: %s", admin_id, e)
+        return False
+
+
+async def notify_admins(bot: Bot, text: str, fallback_chat_id: int):
+    """
+    Надсилає замовлення всім адмінам паралельно.
+    Якщо жодному не дійшло — шле в поточний чат.
+    """
+    results = await asyncio.gather(*(
+        send_to_admin(bot, admin_id, text) for admin_id in ADMIN_IDS if admin_id
+    ))
+    if any(results):
+        return
+
+    try:
+        await bot.send_message(fallback_chat_id, text)
+        logger.debug("Fallback sent to current chat_id=%s", fallback_chat_id)
+    except Exception as e:
+        logger.error("Fallback failed: %s", e)
+
+
 @router.callback_query(Checkout.confirm, F.data == "checkout:confirm")
 async def checkout_confirm(c: CallbackQuery, state: FSMContext, bot: Bot):
     data = await state.get_data()
@@ -621,25 +860,24 @@ async def checkout_confirm(c: CallbackQuery, state: FSMContext, bot: Bot):
         await c.answer("Кошик порожній", show_alert=True)
         return
 
-    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     username = c.from_user.username or ""
     np_type_text = "Відділення" if data["np_type"] == "branch" else "Поштомат"
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with POOL.connection() as db:
         cur = await db.execute("""
             INSERT INTO orders(user_id, username, full_name, phone, city, np_type, np_point, payment, comment, total, created_at)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?)
+            VALUES(?,?,?,?,?,?,?,?,?,?,datetime('now', 'localtime'))
         """, (
             c.from_user.id, username, data["full_name"], data["phone"], data["city"],
-            np_type_text, data["np_point"], data["payment"], data["comment"], total, created
+            np_type_text, data["np_point"], data["payment"], data["comment"], total
         ))
         order_id = cur.lastrowid
 
-        for pid, title, price, qty, variant in items:
-            await db.execute("""
-                INSERT INTO order_items(order_id, product_id, title, variant, price, qty)
-                VALUES(?,?,?,?,?,?)
-            """, (order_id, pid, title, variant or "", price, qty))
+        rows = [(order_id, pid, title, variant or "", price, qty) for pid, title, price, qty, variant in items]
+        await db.executemany("""
+            INSERT INTO order_items(order_id, product_id, title, variant, price, qty)
+            VALUES(?,?,?,?,?,?)
+        """, rows)
 
         await db.execute("DELETE FROM cart WHERE user_id=?", (c.from_user.id,))
         await db.commit()
@@ -663,23 +901,10 @@ async def checkout_confirm(c: CallbackQuery, state: FSMContext, bot: Bot):
     if username:
         admin_text += f"\n👤 Telegram: @{username}"
 
-    sent = False
-    for admin_id in ADMIN_IDS:
-        if admin_id and admin_id != 0:
-            try:
-                await bot.send_message(admin_id, admin_text)
-                print(f"✅ Sent to admin_id={admin_id}")
-                sent = True
-                break
-            except Exception as e:
-                print(f"❌ Failed to send to admin_id={admin_id}: {e}")
-
-    if not sent:
-        try:
-            await bot.send_message(c.message.chat.id, admin_text)
-            print(f"✅ Fallback sent to current chat_id={c.message.chat.id}")
-        except Exception as e:
-            print(f"❌ Fallback failed: {e}")
+    # Адмінів сповіщаємо у фоні — клієнт отримує відповідь одразу.
+    task = asyncio.create_task(notify_admins(bot, admin_text, c.message.chat.id))
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
 
     await state.clear()
     await c.message.answer(f"✅ Замовлення оформлено! Номер: #{order_id}", reply_markup=back_home_kb())
@@ -740,7 +965,7 @@ async def admin_add_title(m: Message, state: FSMContext):
 
 @router.message(AddProduct.price)
 async def admin_add_price(m: Message, state: FSMContext):
-    t = re.sub(r"\D", "", m.text.strip())
+    t = _DIGITS_ONLY.sub("", m.text.strip())
     if not t:
         await m.answer("❗️Ціна має бути числом. Спробуй ще раз.")
         return
@@ -761,15 +986,15 @@ async def admin_add_desc(m: Message, state: FSMContext):
 async def admin_add_variants(m: Message, state: FSMContext):
     variants = parse_variants(m.text)
     data = await state.get_data()
-    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     await db_execute("""
         INSERT INTO products(title, price, description, photo_file_id, variants_json, active, created_at)
-        VALUES(?,?,?,?,?,?,?)
+        VALUES(?,?,?,?,?,?,datetime('now', 'localtime'))
     """, (
         data["title"], data["price"], data["description"], data["photo_file_id"],
-        json.dumps(variants, ensure_ascii=False), 1, created
+        orjson.dumps(variants).decode(), 1
     ))
+    drop_product_cache()
 
     await state.clear()
     await m.answer("✅ Товар додано!", reply_markup=admin_kb())
@@ -781,34 +1006,46 @@ async def admin_products(c: CallbackQuery):
         await c.answer("Нема доступу", show_alert=True)
         return
 
-    page = int(c.data.split(":")[2])
-    offset = page * PAGE_SIZE
+    # admin:products:<id> — товари з id < <id>; 0 — перша сторінка
+    before = int(c.data.split(":")[2])
+    await admin_products_page(c, before)
 
-    rows = await db_fetchall(
-        "SELECT id, title, price, active FROM products ORDER BY id DESC LIMIT ? OFFSET ?",
-        (PAGE_SIZE, offset)
-    )
+
+async def admin_products_page(c: CallbackQuery, before: int):
+    if before:
+        rows = await db_fetchall(
+            "SELECT id, title, price, active FROM products WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before, PAGE_SIZE)
+        )
+    else:
+        rows = await db_fetchall(
+            "SELECT id, title, price, active FROM products ORDER BY id DESC LIMIT ?",
+            (PAGE_SIZE,)
+        )
 
     if not rows:
         await safe_edit_text(c, "Товарів поки немає.", reply_markup=admin_kb())
         await c.answer()
         return
 
-    text = "📦 Товари\n\n"
+    parts = ["📦 Товари\n\n"]
     kb_rows = []
     for pid, title, price, active in rows:
         status = "✅" if active else "⛔️"
-        text += f"{status} #{pid} — {title} — {money(price)}\n"
+        parts.append(f"{status} #{pid} — {title} — {money(price)}\n")
         kb_rows.append([
             InlineKeyboardButton(text=f"{status} {title}", callback_data=f"admin:toggle:{pid}"),
             InlineKeyboardButton(text="🗑", callback_data=f"admin:del:{pid}")
         ])
 
+    text = "".join(parts)
+
     nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"admin:products:{page-1}"))
+    if before:
+        prev = await prev_page_cursor(rows[0][0], active_only=False)
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"admin:products:{prev}"))
     nav.append(InlineKeyboardButton(text="🔧 Меню", callback_data="admin:menu"))
-    nav.append(InlineKeyboardButton(text="➡️", callback_data=f"admin:products:{page+1}"))
+    nav.append(InlineKeyboardButton(text="➡️", callback_data=f"admin:products:{rows[-1][0]}"))
     kb_rows.append(nav)
 
     await safe_edit_text(c, text, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb_rows))
@@ -827,8 +1064,9 @@ async def admin_toggle(c: CallbackQuery):
         return
     new_active = 0 if row[0] == 1 else 1
     await db_execute("UPDATE products SET active=? WHERE id=?", (new_active, pid))
+    drop_product_cache(pid)
     await c.answer("Оновлено ✅")
-    await admin_products(c)
+    await admin_products_page(c, pid + 1)
 
 
 @router.callback_query(F.data.startswith("admin:del:"))
@@ -838,35 +1076,72 @@ async def admin_del(c: CallbackQuery):
         return
     pid = int(c.data.split(":")[2])
     await db_execute("DELETE FROM products WHERE id=?", (pid,))
+    drop_product_cache(pid)
     await c.answer("Видалено 🗑")
-    await admin_products(c)
+    await admin_products_page(c, pid + 1)
 
 
 # ----------------- Main -----------------
+class KeepAliveAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession з довшим keep-alive до API Telegram.
+    Публічного параметра для цього в aiogram немає: AiohttpSession збирає аргументи
+    TCPConnector у _connector_init і використовує їх при створенні ClientSession
+    (перевірено з aiogram 3.31.0).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        connector_init = getattr(self, "_connector_init", None)
+        if not isinstance(connector_init, dict):
+            raise RuntimeError(
+                "AiohttpSession._connector_init not found — "
+                "aiogram changed its internals, update KeepAliveAiohttpSession"
+            )
+        connector_init["keepalive_timeout"] = 75
+
+
 async def start_polling_with_retries(dp: Dispatcher, bot: Bot):
     delay = 3
     while True:
         try:
+            # штатна зупинка (SIGINT/SIGTERM) — виходимо, щоб main() закрив ресурси
             await dp.start_polling(bot)
+            return
         except Exception as e:
-            print(f"❌ Polling crashed: {e}")
-            print(f"⏳ Retry in {delay}s...")
+            logger.error("Polling crashed: %s. Retry in %ss...", e, delay)
             await asyncio.sleep(delay)
             delay = min(delay * 2, 60)
 
 
 async def main():
+    global POOL
     await db_init()
+    POOL = SQLiteConnectionPool(db_connect, pool_size=10)
 
-    session = AiohttpSession(timeout=60)
+    # Одна aiohttp-сесія на весь процес: TLS-з'єднання з API Telegram перевикористовуються.
+    session = KeepAliveAiohttpSession(timeout=60)
     bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties())
 
     dp = Dispatcher()
     dp.include_router(router)
 
-    print("✅ Bot started")
-    await start_polling_with_retries(dp, bot)
+    logger.info("Bot started")
+    try:
+        await start_polling_with_retries(dp, bot)
+    finally:
+        # даємо дійти сповіщенням адмінам про вже оформлені замовлення
+        await asyncio.gather(*_BG_TASKS, return_exceptions=True)
+        await session.close()
+        await POOL.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    log_listener = setup_logging()
+    try:
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
+    finally:
+        log_listener.stop()